@@ -4,15 +4,18 @@ user throught the backend manager (
 :class:`pyqode.core.managers.BackendManager`)
 
 """
+import inspect
+import itertools
 import locale
-import json
 import logging
 import socket
-import struct
 import sys
-import uuid
 from weakref import ref
 from pyqode.qt import QtCore, QtNetwork
+# the payloads are (de)serialised by the same functions on both sides,
+# msgpack is None if it is not installed.
+from pyqode.core.backend.server import (
+    _HEADER, dumps, import_class, loads, msgpack)
 
 
 def _logger():
@@ -27,6 +30,16 @@ def comm(msg, *args):
     _logger().log(COMM, msg, *args)
 
 
+#: Delay before the first connection retry (in ms). The delay is multiplied
+#: by 1.5 for each subsequent retry, up to RETRY_DELAY_MAX.
+RETRY_DELAY_MIN = 20
+#: Maximum delay between two connection retries (in ms)
+RETRY_DELAY_MAX = 500
+#: Time after which the client stops trying to connect, or stops waiting for
+#: the backend port (in ms)
+RETRY_TIMEOUT = 10000
+
+
 #: Dictionary of socket errors messages
 SOCKET_ERROR_STRINGS = {
     0: 'the connection was refused by the peer (or timed out).',
@@ -63,6 +76,37 @@ PROCESS_ERROR_STRING = {
 }
 
 
+#: Line printed by the backend on its standard output when it supports the
+#: msgpack format.
+MSGPACK_SUPPORTED = 'msgpack supported'
+
+#: Cache of the serialised request prefix (``{"worker": ...``) of the workers
+#: already requested, keyed by (worker, binary format)
+_ENVELOPES = {}
+
+#: Request id generator, ids only need to be unique among the requests sent
+#: by this process.
+_REQUEST_IDS = itertools.count(1)
+
+#: Thread pool of the in-process workers (see :func:`_worker_pool`)
+_POOL = None
+
+
+def _worker_pool():
+    """
+    Returns the thread pool used to run the in-process workers.
+
+    The pool has a single thread: the backend server runs the workers one at
+    a time and some workers rely on it (e.g. the class level providers of
+    CodeCompletionWorker).
+    """
+    global _POOL
+    if _POOL is None:
+        _POOL = QtCore.QThreadPool()
+        _POOL.setMaxThreadCount(1)
+    return _POOL
+
+
 if sys.version_info[0] >= 3:
     class WeakMethod(ref):
         """
@@ -168,7 +212,8 @@ class JsonTcpClient(QtNetwork.QTcpSocket):
     It uses a simple message protocol. A message is made up of two parts.
     parts:
       - header: contains the length of the payload. (4bytes)
-      - payload: data as a json string.
+      - payload: data as a json string (or as a msgpack message if ``binary``
+        is True).
 
     """
     #: Internal signal emitted when the backend request finished and the
@@ -177,15 +222,20 @@ class JsonTcpClient(QtNetwork.QTcpSocket):
     finished = QtCore.Signal(QtNetwork.QTcpSocket)
 
     def __init__(self, parent, port, worker_class_or_function, args,
-                 on_receive=None):
+                 on_receive=None, binary=False):
         super(JsonTcpClient, self).__init__(parent)
+        #: backend port, None if not known yet (see :meth:`set_port`)
         self._port = port
+        self._binary = binary and msgpack is not None
         self._worker = worker_class_or_function
         self._args = args
-        self._header_complete = False
-        self._header_buf = bytes()
-        self._to_read = 0
-        self._data_buf = bytes()
+        #: receive buffer, may contain several (partial) messages
+        self._rx = bytearray()
+        #: position of the next message in the receive buffer
+        self._rxhead = 0
+        #: size of the payload being received, None while the header is
+        #: still pending
+        self._need = None
         if on_receive:
             try:
                 self._callback = WeakMethod(on_receive)
@@ -196,10 +246,31 @@ class JsonTcpClient(QtNetwork.QTcpSocket):
             self._callback = None
         self.is_connected = False
         self._closed = False
+        self._retry_delay = RETRY_DELAY_MIN
+        self._retry_elapsed = 0
         self.connected.connect(self._on_connected)
         self.error.connect(self._on_error)
         self.disconnected.connect(self._on_disconnected)
         self.readyRead.connect(self._on_ready_read)
+        if port is not None:
+            self._connect()
+        else:
+            # don't wait forever if the backend never reports its port
+            QtCore.QTimer.singleShot(RETRY_TIMEOUT, self._on_port_timeout)
+
+    def _on_port_timeout(self):
+        if self._port is None and not self._closed:
+            _logger().warning('backend port still unknown, giving up')
+            self.finished.emit(self)
+
+    def set_port(self, port):
+        """
+        Sets the backend port and connects the socket. This is used for
+        sockets created before the backend port was known.
+
+        :param port: the backend port.
+        """
+        self._port = port
         self._connect()
 
     def close(self):
@@ -210,15 +281,39 @@ class JsonTcpClient(QtNetwork.QTcpSocket):
     def _send_request(self):
         """
         Sends the request to the backend.
+
+        The constant part of the request (the worker name) is serialised only
+        once per worker, only the request id and the worker data are
+        serialised for every request.
         """
-        if isinstance(self._worker, str):
-            classname = self._worker
+        key = self._worker, self._binary
+        try:
+            envelope = _ENVELOPES[key]
+        except KeyError:
+            if isinstance(self._worker, str):
+                classname = self._worker
+            else:
+                classname = '%s.%s' % (self._worker.__module__,
+                                       self._worker.__name__)
+            if self._binary:
+                # fixmap header for a map of 3 items
+                envelope = (b'\x83' + dumps('worker', binary=True) +
+                            dumps(classname, binary=True) +
+                            dumps('request_id', binary=True))
+            else:
+                envelope = (b'{"worker":' + dumps(classname) +
+                            b',"request_id":')
+            _ENVELOPES[key] = envelope
+        self.request_id = next(_REQUEST_IDS)
+        if self._binary:
+            msg = (envelope + dumps(self.request_id, binary=True) +
+                   dumps('data', binary=True) +
+                   dumps(self._args, binary=True))
         else:
-            classname = '%s.%s' % (self._worker.__module__,
-                                   self._worker.__name__)
-        self.request_id = str(uuid.uuid4())
-        self.send({'request_id': self.request_id, 'worker': classname,
-                   'data': self._args})
+            msg = (envelope + dumps(self.request_id) + b',"data":' +
+                   dumps(self._args) + b'}')
+        comm('sending request: %r', msg)
+        self._write_message(msg)
 
     def send(self, obj, encoding='utf-8'):
         """
@@ -230,15 +325,24 @@ class JsonTcpClient(QtNetwork.QTcpSocket):
             bytes array, this should match CodeEdit.file.encoding.
         """
         comm('sending request: %r', obj)
-        msg = json.dumps(obj)
-        msg = msg.encode(encoding)
-        header = struct.pack('=I', len(msg))
-        self.write(header)
-        self.write(msg)
+        self._write_message(dumps(obj, encoding=encoding))
+
+    def _write_message(self, msg):
+        """
+        Writes a message (header + payload) on the socket.
+
+        :param msg: the encoded payload (bytes)
+        """
+        # write header and payload at once to avoid sending two tcp segments
+        self.write(_HEADER.pack(len(msg)) + msg)
 
     @staticmethod
     def pick_free_port():
-        """ Picks a free port """
+        """ Picks a free port
+
+        .. deprecated: Since v2.12, the backend picks its own port. This will
+            be removed in v2.14
+        """
         test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         test_socket.bind(('127.0.0.1', 0))
         free_port = int(test_socket.getsockname()[1])
@@ -256,8 +360,13 @@ class JsonTcpClient(QtNetwork.QTcpSocket):
             self.waitForConnected()
 
     def _on_connected(self):
-        comm('connected to backend: %s:%d', self.peerName(), self.peerPort())
+        if _logger().isEnabledFor(COMM):
+            comm('connected to backend: %s:%d', self.peerName(),
+                 self.peerPort())
         self.is_connected = True
+        # requests and responses are small messages, send them right away
+        # instead of waiting for more data (Nagle's algorithm)
+        self.setSocketOption(QtNetwork.QAbstractSocket.LowDelayOption, 1)
         self._send_request()
 
     def _on_error(self, error):
@@ -269,15 +378,30 @@ class JsonTcpClient(QtNetwork.QTcpSocket):
         else:
             log_fct = _logger().warning
 
+        log_fct(SOCKET_ERROR_STRINGS[error])
+
         if error == 0 and not self.is_connected and not self._closed:
-            QtCore.QTimer.singleShot(100, self._connect)
+            self._retry_connect()
 
-        log_fct(SOCKET_ERROR_STRINGS[error])
+    def _retry_connect(self):
+        """
+        Retries to connect to the backend, using an exponential backoff. We
+        give up after RETRY_TIMEOUT ms.
+        """
+        if self._retry_elapsed >= RETRY_TIMEOUT:
+            _logger().warning('failed to connect to the backend, giving up')
+            self.finished.emit(self)
+            return
+        delay = self._retry_delay
+        self._retry_elapsed += delay
+        self._retry_delay = min(int(delay * 1.5), RETRY_DELAY_MAX)
+        QtCore.QTimer.singleShot(delay, self._connect)
 
     def _on_disconnected(self):
         try:
-            comm('disconnected from backend: %s:%d', self.peerName(),
-                 self.peerPort())
+            if _logger().isEnabledFor(COMM):
+                comm('disconnected from backend: %s:%d', self.peerName(),
+                     self.peerPort())
         except (AttributeError, RuntimeError):
             # logger might be None if for some reason qt deletes the socket
             # after python global exit
@@ -287,57 +411,148 @@ class JsonTcpClient(QtNetwork.QTcpSocket):
         except AttributeError:
             pass
 
-    def _read_header(self):
-        comm('reading header')
-        self._header_buf += self.read(4)
-        if len(self._header_buf) == 4:
-            self._header_complete = True
-            try:
-                header = struct.unpack('=I', self._header_buf)
-            except TypeError:
-                # pyside
-                header = struct.unpack('=I', self._header_buf.data())
-            self._to_read = header[0]
-            self._header_buf = bytes()
-            comm('header content: %d', self._to_read)
-
-    def _read_payload(self):
-        """ Reads the payload (=data) """
-        comm('reading payload data')
-        comm('remaining bytes to read: %d', self._to_read)
-        data_read = self.read(self._to_read)
-        nb_bytes_read = len(data_read)
-        comm('%d bytes read', nb_bytes_read)
-        self._data_buf += data_read
-        self._to_read -= nb_bytes_read
-        if self._to_read <= 0:
-            try:
-                data = self._data_buf.decode('utf-8')
-            except AttributeError:
-                data = bytes(self._data_buf.data()).decode('utf-8')
-            comm('payload read: %r', data)
-            comm('payload length: %r', len(self._data_buf))
-            comm('decoding payload as json object')
-            obj = json.loads(data)
+    def _read_payload(self, data):
+        """ Decodes a complete payload and forwards the results to the
+        callback """
+        log_comm = _logger().isEnabledFor(COMM)
+        if log_comm:
+            comm('payload read: %r', bytes(data))
+            comm('payload length: %r', len(data))
+            comm('decoding payload')
+        try:
+            obj = loads(data)
+        finally:
+            if isinstance(data, memoryview):
+                # the receive buffer cannot be resized while a view on it
+                # exists, release it before running the callback (which
+                # might process events and receive more data).
+                data.release()
+        if log_comm:
             comm('response received: %r', obj)
-            try:
-                results = obj['results']
-            except (KeyError, TypeError):
-                results = None
-            # possible callback
-            if self._callback and self._callback():
-                self._callback()(results)
-            self._header_complete = False
-            self._data_buf = bytes()
-            self.finished.emit(self)
+        try:
+            results = obj['results']
+        except (KeyError, TypeError):
+            results = None
+        # possible callback
+        if self._callback and self._callback():
+            self._callback()(results)
+        self.finished.emit(self)
 
     def _on_ready_read(self):
         """ Read bytes when ready read """
-        while self.bytesAvailable():
-            if not self._header_complete:
-                self._read_header()
+        # drop the messages already processed, only when they take more than
+        # half of the buffer to avoid moving the remaining bytes too often
+        if self._rxhead > len(self._rx) // 2:
+            del self._rx[:self._rxhead]
+            self._rxhead = 0
+        data = self.readAll()
+        try:
+            self._rx += bytes(data)
+        except TypeError:
+            # pyside
+            self._rx += bytes(data.data())
+        # process as many complete messages as possible
+        while True:
+            start = self._rxhead + 4
+            if self._need is None:
+                if len(self._rx) < start:
+                    break
+                self._need = _HEADER.unpack_from(self._rx, self._rxhead)[0]
+                comm('header content: %d', self._need)
+            end = start + self._need
+            if len(self._rx) < end:
+                comm('remaining bytes to read: %d', end - len(self._rx))
+                break
+            if sys.version_info[0] >= 3:
+                # decode the payload directly from the receive buffer
+                payload = memoryview(self._rx)[start:end]
             else:
-                self._read_payload()
+                payload = self._rx[start:end]
+            self._rxhead = end
+            self._need = None
+            self._read_payload(payload)
+
+
+class InProcessClient(QtCore.QObject):
+    """
+    Runs a worker in a thread of the current process instead of sending it
+    to the backend process. This avoids the serialisation and the socket
+    round trip. Like in the backend process, the workers are run one at a
+    time (see :func:`_worker_pool`).
+
+    This has the same interface as :class:`JsonTcpClient` so that the
+    backend manager can handle both kind of clients the same way.
+
+    .. note:: The worker args are given to the worker as is, without being
+        copied. They must not be modified while the worker is running.
+    """
+    #: Internal signal emitted when the backend request finished and the
+    #: client can be removed from the list of clients maintained by the
+    #: backend manager
+    finished = QtCore.Signal(QtCore.QObject)
+
+    #: Signal emitted from the pool thread when the worker results are
+    #: available.
+    _results_available = QtCore.Signal(object)
+
+    def __init__(self, parent, worker_class_or_function, args,
+                 on_receive=None):
+        super(InProcessClient, self).__init__(parent)
+        self._worker = worker_class_or_function
+        self._args = args
+        if on_receive:
+            try:
+                self._callback = WeakMethod(on_receive)
+            except TypeError:
+                # unbound method (i.e. free function)
+                self._callback = ref(on_receive)
+        else:
+            self._callback = None
+        self._results_available.connect(self._on_results_available)
+        _worker_pool().start(_WorkerRunnable(self))
+
+    def close(self):
+        self._callback = None
+
+    def run_worker(self):
+        """
+        Runs the worker, this is called from a pool thread.
+        """
+        try:
+            worker = self._worker
+            if isinstance(worker, str):
+                worker = import_class(worker)
+            if inspect.isclass(worker):
+                worker = worker()
+            results = worker(self._args)
+        except Exception:
+            _logger().exception('something went bad with worker %r(data=%r)',
+                                self._worker, self._args)
+            results = None
+        if results is None:
+            results = []
+        try:
+            self._results_available.emit(results)
+        except RuntimeError:
+            # client already deleted
+            pass
+
+    def _on_results_available(self, results):
+        if self._callback and self._callback():
+            self._callback()(results)
+        self.finished.emit(self)
+
+
+class _WorkerRunnable(QtCore.QRunnable):
+    """
+    Runs the worker of an :class:`InProcessClient` in a pool thread.
+    """
+    def __init__(self, client):
+        super(_WorkerRunnable, self).__init__()
+        self._client = client
+
+    def run(self):
+        self._client.run_worker()
 
 
 class BackendProcess(QtCore.QProcess):
@@ -346,6 +561,9 @@ class BackendProcess(QtCore.QProcess):
 
     Also logs everything that is written to the process' stdout/stderr.
     """
+    #: Signal emitted when the backend port is known
+    port_ready = QtCore.Signal(int)
+
     def __init__(self, parent):
         super(BackendProcess, self).__init__(parent)
         self.started.connect(self._on_process_started)
@@ -358,6 +576,16 @@ class BackendProcess(QtCore.QProcess):
         self._srv_logger = logging.getLogger('pyqode.backend')
         self._prevent_logs = False
         self._encoding = locale.getpreferredencoding()
+        # incomplete output lines, kept until the end of line is received
+        self._stdout_buf = bytearray()
+        self._stderr_buf = bytearray()
+        #: True if the backend supports the msgpack format. This is only
+        #: known once the backend has printed its startup messages.
+        self.supports_msgpack = False
+        #: The port the backend is listening on, None until the backend has
+        #: printed its startup messages.
+        self.port = None
+        self._startup_done = False
 
     def _on_process_started(self):
         """ Logs process started """
@@ -383,18 +611,69 @@ class BackendProcess(QtCore.QProcess):
             self.running = False
         except AttributeError:
             pass
+        else:
+            # log incomplete lines that are still buffered
+            for line in self._decode_lines(self._stdout_buf, final=True):
+                self._srv_logger.log(COMM, line)
+            for line in self._decode_lines(self._stderr_buf, final=True):
+                self._srv_logger.error(line)
+
+    def _decode_lines(self, buf, data=b'', final=False):
+        """
+        Appends data to an output buffer and returns the complete lines
+        it contains. The incomplete last line stays in the buffer until more
+        data arrives (or until the process finished, see ``final``).
+
+        :param buf: the stdout or stderr buffer (bytearray)
+        :param data: data read from the process (QByteArray)
+        :param final: True to return the incomplete last line too.
+        """
+        try:
+            buf += bytes(data)
+        except TypeError:
+            buf += bytes(data.data())
+        if final:
+            end = len(buf)
+        else:
+            end = buf.rfind(b'\n') + 1
+        if not end:
+            return []
+        output = bytes(buf[:end]).decode(self._encoding, 'replace')
+        del buf[:end]
+        return output.splitlines()
 
     def _on_process_stdout_ready(self):
         """ Logs process output """
         if not self:
             return
         o = self.readAllStandardOutput()
-        try:
-            output = bytes(o).decode(self._encoding)
-        except TypeError:
-            output = bytes(o.data()).decode(self._encoding)
-        for line in output.splitlines():
-            self._srv_logger.log(1, line)
+        if self._startup_done and not self._srv_logger.isEnabledFor(COMM):
+            return
+        for line in self._decode_lines(self._stdout_buf, o):
+            if not self._startup_done:
+                self._parse_startup_message(line)
+            self._srv_logger.log(COMM, line)
+
+    def _parse_startup_message(self, line):
+        """ Parses the messages printed by the server when it starts """
+        if line == MSGPACK_SUPPORTED:
+            self.supports_msgpack = msgpack is not None
+        elif line.startswith('started on'):
+            self._startup_done = True
+            try:
+                port = int(line.rsplit(':', 1)[1])
+            except (IndexError, ValueError):
+                port = 0
+            if port:
+                self.port = port
+                self.port_ready.emit(port)
+            else:
+                # backend from an older pyqode version, it does not report
+                # the port picked by the system.
+                _logger().warning(
+                    'failed to get the backend port, if the backend uses '
+                    'pyqode.core < 2.12, pass a free port to '
+                    'BackendManager.start (port argument)')
 
     def _on_process_stderr_ready(self):
         """ Logs process output (stderr) """
@@ -403,11 +682,7 @@ class BackendProcess(QtCore.QProcess):
         except (TypeError, RuntimeError):
             # widget already deleted
             return
-        try:
-            output = bytes(o).decode(self._encoding)
-        except TypeError:
-            output = bytes(o.data()).decode(self._encoding)
-        for line in output.splitlines():
+        for line in self._decode_lines(self._stderr_buf, o):
             self._srv_logger.error(line)
 
     def terminate(self):
@@ -17,13 +17,20 @@ parts:
   - a header: simply contains the length of the payload
   - a payload: a json formatted string, the content of the message.
 
+If the msgpack package (>= 0.6.1) is available, the server prints "msgpack
+supported" on its standard output when it starts. The client may then send
+msgpack payloads instead of json. The server detects the payload format from
+its first byte (a msgpack map marker) and replies using the same format. Both
+formats decode to the same python objects: map keys that are not strings are
+converted to strings, like json does.
+
 There are two type of json object: a request and a response.
 
 Request
 +++++++
 For a request, the object will contains the following fields:
 
-  - 'request_id': uuid generated client side
+  - 'request_id': unique id generated client side
   - 'worker': fully qualified name to the worker callable (class or function),
     e.g. 'pyqode.core.backend.workers.echo_worker'
   - 'data': data specific to the chose worker.
@@ -31,7 +38,7 @@ For a request, the object will contains the following fields:
 E.g::
 
     {
-        'request_id': 'a97285af-cc88-48a4-ac69-7459b9c7fa66',
+        'request_id': 42,
         'worker': 'pyqode.core.backend.workers.echo_worker',
         'data': ['some code', 0]
     }
@@ -40,16 +47,31 @@ Response
 ++++++++
 
 For a response, the object will contains the following fields:
-    - 'request_id': uuid generated client side that is simply echoed back
+    - 'request_id': id generated client side that is simply echoed back
     - 'results': worker results (list, tuple, string,...)
 
 E.g::
 
     {
-        'request_id': 'a97285af-cc88-48a4-ac69-7459b9c7fa66',
+        'request_id': 42,
         'results': ['some code', 0]
     }
 
+Startup
++++++++
+
+The backend is started with the tcp port to use as its first command line
+argument. Since pyqode 2.12, the client passes 0 by default: the server binds
+a free port picked by the system and reports it on its standard output with
+the following line (which must be flushed)::
+
+    started on 127.0.0.1:<port>
+
+The client sends its requests once it has read this line. Backends that use
+an older pyqode.core always report the port they were given, i.e. 0. For
+those backends, pass a free port to
+:meth:`pyqode.core.managers.BackendManager.start` (``port`` argument).
+
 Server script
 -------------
 
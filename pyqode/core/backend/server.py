@@ -7,12 +7,30 @@ import inspect
 import logging
 import json
 import os
+import socket
 import struct
 import sys
 import time
 import traceback
 import threading
 
+try:
+    # orjson is an optional (but much faster) replacement for the json module
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # msgpack is optional, when available on both sides, it is used instead
+    # of json (see pyqode.core.api.client.BackendProcess.supports_msgpack)
+    import msgpack
+except ImportError:
+    msgpack = None
+else:
+    if getattr(msgpack, 'version', (0, )) < (0, 6, 1):
+        # strict_map_key (see loads) is not supported, don't advertise
+        # msgpack support
+        msgpack = None
 
 try:
     import socketserver
@@ -29,6 +47,73 @@ def _logger():
 
 HEARTBEAT_DELAY = 60  # delay max without heartbeat signal
 
+#: Message header: the length of the payload
+_HEADER = struct.Struct('=I')
+
+
+def is_msgpack_payload(data):
+    """
+    Checks if a message payload is a msgpack map (requests and responses are
+    always maps). Anything else is considered as json.
+
+    :param data: payload (bytes, bytearray or memoryview)
+    :return: True if msgpack is available and the payload starts with a
+        msgpack map marker (fixmap, map16 or map32).
+    """
+    if msgpack is None:
+        return False
+    marker = bytearray(data[:1])
+    return bool(marker) and (0x80 <= marker[0] <= 0x8f or
+                             marker[0] in (0xde, 0xdf))
+
+
+def dumps(obj, binary=False, encoding='utf-8'):
+    """
+    Serialises a message payload. This is used by both the client and the
+    server.
+
+    :param obj: object to serialise, must be JSON serialisable.
+    :param binary: True to use the msgpack format instead of json.
+    :param encoding: encoding used when falling back to the json module.
+    :return: the payload (bytes)
+    """
+    if binary:
+        return msgpack.packb(obj, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj).encode(encoding)
+
+
+def _json_map(pairs):
+    """
+    Builds a dict from decoded msgpack map items, converting the keys that
+    are not strings the way json does (e.g. 1 -> '1', None -> 'null').
+    """
+    return dict((json.dumps(k) if k is None or isinstance(k, (int, float))
+                 else k, v) for k, v in pairs)
+
+
+def loads(data):
+    """
+    Deserialises a message payload (msgpack map or json). This is used by
+    both the client and the server.
+
+    Both formats give the same objects: the map keys that are not strings
+    are converted to strings, like json does.
+
+    :param data: payload (bytes, bytearray or memoryview)
+    """
+    if is_msgpack_payload(data):
+        try:
+            return msgpack.unpackb(data, raw=False, strict_map_key=True)
+        except ValueError:
+            # some keys are not strings (slow path)
+            return msgpack.unpackb(data, raw=False, strict_map_key=False,
+                                   object_pairs_hook=_json_map)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data).decode('utf-8'))
+
 
 def import_class(klass):
     """
@@ -58,6 +143,9 @@ class JsonServer(socketserver.TCPServer):
     """
 
     class _Handler(socketserver.BaseRequestHandler):
+        #: True if the request (and thus the response) uses msgpack
+        binary = False
+
         def read_bytes(self, size):
             """
             Read x bytes
@@ -65,28 +153,31 @@ class JsonServer(socketserver.TCPServer):
             :param size: number of bytes to read.
 
             """
-            if not PY33:
-                data = ''
-            else:
-                data = bytes()
-            while len(data) < size:
-                tmp = self.request.recv(size - len(data))
-                data += tmp
-                if tmp == '':
+            # receive directly into the final buffer, the payload is
+            # decoded from this buffer without any further copy.
+            data = bytearray(size)
+            view = memoryview(data)
+            received = 0
+            while received < size:
+                nbytes = self.request.recv_into(view[received:])
+                if not nbytes:
                     raise RuntimeError("socket connection broken")
+                received += nbytes
             return data
 
         def get_msg_len(self):
             """ Gets message len """
             data = self.read_bytes(4)
-            payload = struct.unpack('=I', data)
+            payload = _HEADER.unpack(data)
             return payload[0]
 
         def read(self):
             """ Reads a json string from socket and load it. """
             size = self.get_msg_len()
-            data = self.read_bytes(size).decode('utf-8')
-            return json.loads(data)
+            data = self.read_bytes(size)
+            # the response is sent using the same format as the request
+            self.binary = is_msgpack_payload(data)
+            return loads(data)
 
         def send(self, obj):
             """
@@ -94,11 +185,9 @@ class JsonServer(socketserver.TCPServer):
 
             :param obj: The object to send, must be Json serializable.
             """
-            msg = json.dumps(obj).encode('utf-8')
+            msg = dumps(obj, binary=self.binary)
             _logger().log(1, 'sending %d bytes for the payload', len(msg))
-            header = struct.pack('=I', len(msg))
-            self.request.sendall(header)
-            self.request.sendall(msg)
+            self.request.sendall(_HEADER.pack(len(msg)) + msg)
 
         def handle(self):
             """
@@ -106,6 +195,9 @@ class JsonServer(socketserver.TCPServer):
             has not been received
             """
             self.srv.reset_heartbeat()
+            # send the response right away (disable Nagle's algorithm)
+            self.request.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             # make sure to have enough time to handle the request
             self.srv.timeout = HEARTBEAT_DELAY * 10
             data = self.read()
@@ -163,13 +255,22 @@ class JsonServer(socketserver.TCPServer):
         self.reset_heartbeat()
         if not args:
             args = default_parser().parse_args()
-        self.port = args.port
         self.timeout = HEARTBEAT_DELAY
         self._Handler.srv = self
         socketserver.TCPServer.__init__(
             self, ('127.0.0.1', int(args.port)), self._Handler)
-        print('started on 127.0.0.1:%d' % int(args.port))
+        # the actual port (if args.port is 0, the system picked a free port)
+        self.port = self.server_address[1]
+        if msgpack is not None:
+            # tell the client it can send msgpack requests, this must be
+            # printed before the "started on" message.
+            print('msgpack supported')
+        # the client reads the port from this message, don't change it!
+        print('started on 127.0.0.1:%d' % self.port)
         print('running with python %d.%d.%d' % (sys.version_info[:3]))
+        # the client waits for those messages, don't let them sit in the
+        # stdout buffer (sys.stdout is only unbuffered in serve_forever)
+        sys.stdout.flush()
         self._heartbeat_thread = threading.Thread(target=self.heartbeat)
         self._heartbeat_thread.setDaemon(True)
         self._heartbeat_thread.start()
@@ -193,8 +294,8 @@ def default_parser():
     parser as a base if you want to add custom arguments.
 
     The default parser only has one argument, the tcp port used to start the
-    server socket. *(CodeEdit picks up a free port and use it to run
-    the server and connect its client socket)*
+    server socket. *(CodeEdit passes 0 to let the system pick a free port and
+    reads the actual port from the server output)*
 
     :returns: The default server argument parser.
     """
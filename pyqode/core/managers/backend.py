@@ -4,9 +4,12 @@ This module contains the backend controller
 import logging
 import socket
 import sys
+from collections import OrderedDict
+
 from pyqode.qt import QtCore
 
-from pyqode.core.api.client import JsonTcpClient, BackendProcess
+from pyqode.core.api.client import (
+    JsonTcpClient, BackendProcess, InProcessClient)
 from pyqode.core.api.manager import Manager
 from pyqode.core.backend import NotRunning, echo_worker
 
@@ -36,6 +39,8 @@ class BackendManager(Manager):
         - send_request
 
     """
+    #: .. deprecated: Since v2.12, the backend picks its own port, see
+    #:     BackendProcess.port. This will be removed in v2.14
     LAST_PORT = None
     LAST_PROCESS = None
     SHARE_COUNT = 0
@@ -43,11 +48,14 @@ class BackendManager(Manager):
     def __init__(self, editor):
         super(BackendManager, self).__init__(editor)
         self._process = None
-        self._sockets = []
+        #: clients of the pending requests, in the order they were created
+        #: (values are unused)
+        self._sockets = OrderedDict()
         self.server_script = None
         self.interpreter = None
         self.args = None
         self._shared = False
+        self._in_process = False
         self._heartbeat_timer = QtCore.QTimer()
         self._heartbeat_timer.setInterval(1000)
         self._heartbeat_timer.timeout.connect(self._send_heartbeat)
@@ -55,7 +63,8 @@ class BackendManager(Manager):
 
     @staticmethod
     def pick_free_port():
-        """ Picks a free port """
+        """ Picks a free port, see the ``port`` argument of :meth:`start`.
+        """
         test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         test_socket.bind(('127.0.0.1', 0))
         free_port = int(test_socket.getsockname()[1])
@@ -63,7 +72,8 @@ class BackendManager(Manager):
         return free_port
 
     def start(self, script, interpreter=sys.executable, args=None,
-              error_callback=None, reuse=False):
+              error_callback=None, reuse=False, in_process=False,
+              port=None):
         """
         Starts the backend process.
 
@@ -88,11 +98,37 @@ class BackendManager(Manager):
             you're creating an app which supports multiple programming
             languages you will need to merge all backend scripts into one
             single script, otherwise the wrong script might be picked up).
+        :param in_process: True to run the workers in a (single) thread of the
+            current process instead of starting a backend process. This removes
+            the communication overhead but the workers will compete with
+            the GUI for the GIL. The backend script is not executed, your
+            application must configure the workers itself (e.g. the code
+            completion providers).
+        :param port: The port to run the backend on. If None (default), the
+            backend picks a free port and reports it on its standard output.
+            Backends that use an older pyqode.core (< 2.12) do not report
+            the port they are running on, you must give them a free port
+            (see :meth:`pick_free_port`).
         """
+        if in_process:
+            if self.running:
+                self.stop()
+            if self._process is not None:
+                # the (shared) process might still be starting
+                self._disconnect_process()
+                self._process = None
+            self._shared = False
+            self._in_process = True
+            self._heartbeat_timer.stop()
+            comm('running workers in process')
+            return
+        if self._in_process:
+            # back to a backend process
+            self.stop()
         self._shared = reuse
         if reuse and BackendManager.SHARE_COUNT:
-            self._port = BackendManager.LAST_PORT
             self._process = BackendManager.LAST_PROCESS
+            self._process.port_ready.connect(self._on_port_ready)
             BackendManager.SHARE_COUNT += 1
         else:
             if self.running:
@@ -101,25 +137,31 @@ class BackendManager(Manager):
             self.interpreter = interpreter
             self.args = args
             backend_script = script.replace('.pyc', '.py')
-            self._port = self.pick_free_port()
             if hasattr(sys, "frozen") and not backend_script.endswith('.py'):
                 # frozen backend script on windows/mac does not need an
                 # interpreter
                 program = backend_script
-                pgm_args = [str(self._port)]
+                pgm_args = []
             else:
                 program = interpreter
-                pgm_args = [backend_script, str(self._port)]
+                pgm_args = [backend_script]
+            # port 0: let the backend pick a free port, we will read it from
+            # its output (see BackendProcess.port_ready)
+            pgm_args.append(str(port or 0))
             if args:
                 pgm_args += args
             self._process = BackendProcess(self.editor)
+            if port:
+                # the requests can be sent without waiting for the backend
+                # output
+                self._process.port = port
+            self._process.port_ready.connect(self._on_port_ready)
             if error_callback:
                 self._process.error.connect(error_callback)
             self._process.start(program, pgm_args)
 
             if reuse:
                 BackendManager.LAST_PROCESS = self._process
-                BackendManager.LAST_PORT = self._port
                 BackendManager.SHARE_COUNT += 1
             comm('starting backend process: %s %s', program,
                  ' '.join(pgm_args))
@@ -129,19 +171,26 @@ class BackendManager(Manager):
         """
         Stops the backend process.
         """
+        if self._in_process:
+            self._in_process = False
+            for s in list(self._sockets):
+                s.close()
+            self._sockets.clear()
+            return
         if self._process is None:
             return
         if self._shared:
             BackendManager.SHARE_COUNT -= 1
             if BackendManager.SHARE_COUNT:
+                self._disconnect_process()
                 return
         comm('stopping backend process')
         # close all sockets
-        for s in self._sockets:
+        for s in list(self._sockets):
             s._callback = None
             s.close()
 
-        self._sockets[:] = []
+        self._sockets.clear()
         # prevent crash logs from being written if we are busy killing
         # the process
         self._process._prevent_logs = True
@@ -181,30 +230,60 @@ class BackendManager(Manager):
             finally:
                 # caller should try again, later
                 raise NotRunning()
+        elif self._in_process:
+            comm('running worker in process, worker=%r',
+                 worker_class_or_function)
+            client = InProcessClient(self.editor, worker_class_or_function,
+                                     args, on_receive=on_receive)
+            client.finished.connect(self._rm_socket)
+            self._sockets[client] = None
         else:
-            comm('sending request, worker=%r' % worker_class_or_function)
+            comm('sending request, worker=%r', worker_class_or_function)
             # create a socket, the request will be send as soon as the socket
-            # has connected
+            # has connected (the socket will connect as soon as the backend
+            # port is known)
             socket = JsonTcpClient(
-                self.editor, self._port, worker_class_or_function, args,
-                on_receive=on_receive)
+                self.editor, self._process.port, worker_class_or_function,
+                args, on_receive=on_receive,
+                binary=self._process.supports_msgpack)
             socket.finished.connect(self._rm_socket)
-            self._sockets.append(socket)
+            self._sockets[socket] = None
             # restart heartbeat timer
             self._heartbeat_timer.start()
 
     def _send_heartbeat(self):
+        if (self.running and not self._in_process and
+                self._process.port is None):
+            # port not known yet (or not reported by an old backend), the
+            # request would only wait for the port
+            return
         try:
             self.send_request(echo_worker, {'heartbeat': True})
         except NotRunning:
             self._heartbeat_timer.stop()
 
+    def _on_port_ready(self, port):
+        """ Connects the sockets created before the backend port was known """
+        if self._shared:
+            BackendManager.LAST_PORT = port
+        for s in list(self._sockets):
+            if isinstance(s, JsonTcpClient) and s._port is None:
+                s.set_port(port)
+
+    def _disconnect_process(self):
+        """ Stops listening to the port_ready signal of the process """
+        try:
+            self._process.port_ready.disconnect(self._on_port_ready)
+        except (TypeError, RuntimeError):
+            # not connected or process already deleted
+            pass
+
     def _rm_socket(self, socket):
         try:
             socket.close()
-            self._sockets.remove(socket)
+            del self._sockets[socket]
             socket.deleteLater()
-        except ValueError:
+        except KeyError:
             pass
 
     @property
@@ -214,6 +293,8 @@ class BackendManager(Manager):
 
         :return: True if the process is running, otherwise False
         """
+        if self._in_process:
+            return True
         try:
             return (self._process is not None and
                     self._process.state() != self._process.NotRunning)
@@ -373,7 +373,7 @@ class CodeCompletionMode(Mode, QtCore.QObject):
                 self._show_popup(index=self._completer.completionCount() - 1)
                 event.accept()
 
-        debug('key pressed: %s' % event.text())
+        debug('key pressed: %s', event.text())
         is_shortcut = self._is_shortcut(event)
         # handle completer popup events ourselves
         if self._completer.popup().isVisible():
@@ -389,10 +389,10 @@ class CodeCompletionMode(Mode, QtCore.QObject):
     def _on_key_released(self, event):
         if self._is_shortcut(event) or event.isAccepted():
             return
-        debug('key released:%s' % event.text())
+        debug('key released:%s', event.text())
         word = self._helper.word_under_cursor(
             select_whole_word=True).selectedText()
-        debug('word: %s' % word)
+        debug('word: %s', word)
         if event.text():
             if event.key() == QtCore.Qt.Key_Escape:
                 self._hide_popup()
@@ -590,7 +590,7 @@ class CodeCompletionMode(Mode, QtCore.QObject):
                 debug('cannot show popup, editor is not visible')
 
     def _show_completions(self, completions):
-        debug("showing %d completions" % len(completions))
+        debug("showing %d completions", len(completions))
         debug('popup state: %r', self._completer.popup().isVisible())
         t = time.time()
         self._update_model(completions)
@@ -4,6 +4,7 @@ Contains a panel to manage unicode decoding/encoding errors.
 """
 from pyqode.core.api.panel import Panel
 from pyqode.core.api.decoration import TextDecoration
+from pyqode.core.modes.caret_line_highlight import CaretLineHighlighterMode
 from pyqode.qt import QtCore, QtGui, QtWidgets
 
 
@@ -110,8 +111,6 @@ class EncodingPanel(Panel):
 
     def enable_caret_line(self, value=True):
         try:
-            from pyqode.core.modes import CaretLineHighlighterMode
-
             mode = self.editor.modes.get(CaretLineHighlighterMode)
         except KeyError:
             pass
@@ -124,11 +123,13 @@ class EncodingPanel(Panel):
         self.ui.lblDescription.setText(
             self._description % (_('There was a problem opening the file %r') %
                                  path))
-        # load text as binary and mark it as red, user might make use the
-        # binary to recognize the original encoding
+        # load the first bytes and mark them as red, user might make use of
+        # them to recognize the original encoding. latin-1 maps every byte to
+        # a character so that the bytes are shown as is (str() would show the
+        # bytes repr: "b'...'").
         try:
             with open(path, 'rb') as file:
-                content = str(file.read(16))
+                content = file.read(64).decode('latin-1')
         except OSError:
             content = ''
         # set plain text
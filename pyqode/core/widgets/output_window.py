@@ -503,9 +503,15 @@ class AnsiEscapeCodeParser(object):
     _semicolon = ';'
     _color_terminator = 'm'
 
-    _supported_commands = re.compile(r'^(?P<n>\d*;?\d*)(?P<cmd>[ABCDEFGHJKfP]{1})')
-    _unsupported_command = re.compile(r'^(\?\d+h)|^(\??\d+l)|^(\d+d)|^(\d+X)|^(\([AB01])|'
-                                      r'^(\)[AB01])|^(\d*;?\d*r)|^(=)|^(>)|^(\d;.*\x07)')
+    # those patterns are matched at the current parser position (pattern.match(text, pos)), they must not
+    # be anchored with '^'
+    _supported_commands = re.compile(r'(?P<n>\d*;?\d*)(?P<cmd>[ABCDEFGHJKfP]{1})')
+    _unsupported_command = re.compile(r'(\?\d+h)|(\??\d+l)|(\d+d)|(\d+X)|(\([AB01])|'
+                                      r'(\)[AB01])|(\d*;?\d*r)|(=)|(>)|(\d;.*\x07)')
+    # operating system command (e.g. window title) whose terminating BEL has not been received yet
+    _incomplete_osc = re.compile(r'(\d(;[^\x07\n]*)?)?\Z')
+    # Select Graphic Rendition parameters: numbers separated by semicolons
+    _sgr_parameters = re.compile(r'(?:\d+;)*\d*')
 
     _commands = {
         'A': 'cursor_up',
@@ -548,97 +554,94 @@ class AnsiEscapeCodeParser(object):
         fmt = formatted_text.fmt if self._prev_fmt_closed else self._prev_fmt
         fmt = QtGui.QTextCharFormat(fmt)
         if not self._pending_text:
-            stripped_text = formatted_text.txt
+            text = formatted_text.txt
         else:
-            stripped_text = self._pending_text + formatted_text.txt
+            text = self._pending_text + formatted_text.txt
             self._pending_text = ''
-        while stripped_text:
-            try:
-                escape_pos = stripped_text.index(self._escape[0])
-            except ValueError:
-                ret_val.append(Operation('draw', FormattedText(stripped_text, fmt)))
+        # the text is never sliced while parsing (this would copy the remaining text for each operation), we just
+        # move the current position (pos) forward.
+        pos = 0
+        length = len(text)
+        while pos < length:
+            escape_pos = text.find(self._escape[0], pos)
+            if escape_pos == -1:
+                ret_val.append(Operation('draw', FormattedText(text[pos:], fmt)))
                 break
-            else:
-                if escape_pos != 0:
-                    ret_val.append(Operation('draw', FormattedText(stripped_text[:escape_pos], fmt)))
-                    stripped_text = stripped_text[escape_pos:]
-                    fmt = QtGui.QTextCharFormat(fmt)
-            assert stripped_text[0] == self._escape[0]
-            while stripped_text and stripped_text[0] == self._escape[0]:
-                if self._escape.startswith(stripped_text):
+            elif escape_pos != pos:
+                ret_val.append(Operation('draw', FormattedText(text[pos:escape_pos], fmt)))
+                pos = escape_pos
+                fmt = QtGui.QTextCharFormat(fmt)
+            assert text[pos] == self._escape[0]
+            while pos < length and text[pos] == self._escape[0]:
+                if length - pos <= self._escape_len and self._escape.startswith(text[pos:]):
                     # control sequence not complete
-                    self._pending_text += stripped_text
-                    stripped_text = ''
+                    self._pending_text += text[pos:]
+                    pos = length
                     break
-                if not stripped_text.startswith(self._escape):
+                if not text.startswith(self._escape, pos):
                     # check vt100 escape sequences
                     ctrl_seq = False
                     for alt_seq in self._escape_alts:
-                        if stripped_text.startswith(alt_seq):
+                        if text.startswith(alt_seq, pos):
                             ctrl_seq = True
                             break
                     if not ctrl_seq:
                         # not a control sequence
                         self._pending_text = ''
-                        ret_val.append(Operation('draw', FormattedText(stripped_text[:1], fmt)))
+                        ret_val.append(Operation('draw', FormattedText(text[pos], fmt)))
                         fmt = QtGui.QTextCharFormat(fmt)
-                        stripped_text = stripped_text[1:]
+                        pos += 1
                         continue
-                self._pending_text += _mid(stripped_text, 0, self._escape_len)
-                stripped_text = stripped_text[self._escape_len:]
+                self._pending_text += text[pos:pos + self._escape_len]
+                pos += self._escape_len
 
                 # Non draw related command (cursor/erase)
                 if self._pending_text in [self._escape] + self._escape_alts:
-                    m = self._supported_commands.match(stripped_text)
+                    m = self._supported_commands.match(text, pos)
                     if m and self._pending_text == self._escape:
-                        _, e = m.span()
                         n = m.group('n')
                         cmd = m.group('cmd')
                         if not n:
                             n = 0
                         ret_val.append(Operation(self._commands[cmd], n))
                         self._pending_text = ''
-                        stripped_text = stripped_text[e:]
+                        pos = m.end()
                         continue
                     else:
-                        m = self._unsupported_command.match(stripped_text)
+                        m = self._unsupported_command.match(text, pos)
                         if m:
                             self._pending_text = ''
-                            stripped_text = stripped_text[m.span()[1]:]
+                            pos = m.end()
                             continue
                         elif self._pending_text in ['\x1b=', '\x1b>']:
                             self._pending_text = ''
                             continue
+                        elif self._pending_text == '\x1b]' and self._incomplete_osc.match(text, pos):
+                            # wait for the end of the command
+                            self._pending_text += text[pos:]
+                            pos = length
+                            break
 
                 # Handle Select Graphic Rendition commands
-                # get the number
-                str_nbr = ''
-                numbers = []
-                while stripped_text:
-                    if stripped_text[0].isdigit():
-                        str_nbr += stripped_text[0]
-                    else:
-                        if str_nbr:
-                            numbers.append(str_nbr)
-                        if not str_nbr or stripped_text[0] != self._semicolon:
-                            break
-                        str_nbr = ''
-                    self._pending_text += _mid(stripped_text, 0, 1)
-                    stripped_text = stripped_text[1:]
+                # get the numbers
+                m = self._sgr_parameters.match(text, pos)
+                self._pending_text += m.group()
+                pos = m.end()
+                numbers = [nbr for nbr in m.group().split(self._semicolon) if nbr]
 
-                if not stripped_text:
+                if pos >= length:
                     break
 
                 # remove terminating char
-                if not stripped_text.startswith(self._color_terminator):
-                    # _logger().warn('removing %s', repr(self._pending_text + stripped_text[0]))
+                if not text.startswith(self._color_terminator, pos):
+                    # _logger().warn('removing %s', repr(self._pending_text + text[pos]))
                     self._pending_text = ''
-                    stripped_text = stripped_text[1:]
+                    pos += 1
                     break
 
                 # got consistent control sequence, ok to clear pending text
                 self._pending_text = ''
-                stripped_text = stripped_text[1:]
+                pos += 1
 
                 if not numbers:
                     fmt = QtGui.QTextCharFormat(formatted_text.fmt)
@@ -750,15 +753,6 @@ class AnsiEscapeCodeParser(object):
         self._prev_fmt_closed = False
 
 
-def _mid(string, start, end=None):
-    """
-    Returns a substring delimited by start and end position.
-    """
-    if end is None:
-        end = len(string)
-    return string[start:start + end]
-
-
 def _ansi_color(code, theme):
     """
     Converts an ansi code to a QColor, taking the color scheme (theme) into account.
@@ -3,9 +3,9 @@
 """
 Setup script for pyqode.core
 """
+import ast
 from setuptools import setup, find_packages
 from setuptools.command.test import test as TestCommand
-from pyqode.core import __version__
 
 #
 # add ``build_ui command`` (optional, for development only)
@@ -59,6 +59,19 @@ if sys.version_info[0] == 3 and sys.version_info[1] == 2:
 DESCRIPTION = 'PyQt/PySide Source Code Editor Widget'
 
 
+def version():
+    """
+    Reads the package version from pyqode/core/__init__.py without importing
+    the package.
+    """
+    with open(os.path.join('pyqode', 'core', '__init__.py')) as f:
+        for node in ast.parse(f.read()).body:
+            if (isinstance(node, ast.Assign) and
+                    getattr(node.targets[0], 'id', None) == '__version__'):
+                return ast.literal_eval(node.value)
+    raise RuntimeError('unable to find the package version')
+
+
 def readme():
     if 'bdist_deb' in sys.argv or 'sdist_dsc' in sys.argv:
         return DESCRIPTION
@@ -68,7 +81,7 @@ def readme():
 setup(
     name='pyqode.core',
     namespace_packages=['pyqode'],
-    version=__version__,
+    version=version(),
     packages=[p for p in find_packages() if 'test' not in p],
     keywords=["CodeEdit PyQt source code editor widget qt"],
     url='https://github.com/pyQode/pyqode.core',
@@ -2,3 +2,74 @@
 """
 Test the client/server API
 """
+import socket
+import sys
+from pyqode.qt import QtWidgets
+from pyqode.qt.QtTest import QTest
+from pyqode.core import backend
+from pyqode.core.api import client
+from pyqode.core.api.client import BackendProcess
+from ..helpers import server_path
+
+
+_ports = []
+
+
+def _on_port_ready(port):
+    _ports.append(port)
+
+
+def test_port_ready():
+    """
+    The backend is started on port 0 and picks a free port by itself. Checks
+    that the process reports the port the server is actually listening on.
+    """
+    win = QtWidgets.QMainWindow()
+    process = BackendProcess(win)
+    process.port_ready.connect(_on_port_ready)
+    process.start(sys.executable, [server_path(), '0'])
+    for i in range(50):
+        if _ports:
+            break
+        QTest.qWait(100)
+    process._prevent_logs = True
+    process.terminate()
+    process.waitForFinished()
+    assert len(_ports) == 1
+    assert _ports[0] != 0
+    assert _ports[0] == process.port
+
+
+_finished = []
+
+
+def _on_finished(sock):
+    _finished.append(sock)
+
+
+def test_retry_connect_gives_up():
+    """
+    Nothing listens on the port: the client retries to connect for
+    RETRY_TIMEOUT ms then gives up and emits finished.
+    """
+    timeout = client.RETRY_TIMEOUT
+    client.RETRY_TIMEOUT = 500
+    try:
+        # get a port nobody is listening on
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+        s.close()
+        win = QtWidgets.QMainWindow()
+        sock = client.JsonTcpClient(win, port, backend.echo_worker,
+                                    'some data')
+        sock.finished.connect(_on_finished)
+        for i in range(50):
+            if _finished:
+                break
+            QTest.qWait(100)
+        assert _finished == [sock]
+        assert sock._retry_elapsed >= client.RETRY_TIMEOUT
+        sock.close()
+    finally:
+        client.RETRY_TIMEOUT = timeout
@@ -1,13 +1,17 @@
 import os
 import sys
+import time
 from pyqode.core.api import CodeEdit
 from pyqode.core.backend import NotRunning
-from pyqode.qt import QtWidgets
+from pyqode.qt import QtCore, QtWidgets
 import pytest
 from pyqode.qt.QtTest import QTest
 from pyqode.core import backend
+from pyqode.core.api.client import InProcessClient
 from pyqode.core.managers.backend import BackendManager
 from ..helpers import cwd_at, python2_path, server_path, wait_for_connected
+# None if msgpack is not installed (or too old)
+from pyqode.core.backend.server import msgpack
 
 
 from ..helpers import editor_open, ensure_connected
@@ -95,3 +99,160 @@ def test_frozen_server():
         backend_manager.send_request(
             backend.echo_worker, 'some data', on_receive=_on_receive)
     backend_manager.start('server.exe')
+
+
+_msgpack_results = []
+
+
+def _on_msgpack_receive(results):
+    _msgpack_results.append(results)
+
+
+@pytest.mark.skipif(msgpack is None, reason='msgpack is not installed')
+@cwd_at('test')
+def test_client_server_msgpack():
+    """
+    Checks the echo round trip before (json) and after (msgpack) the backend
+    has told us it supports msgpack. Both must give the same results, with
+    json semantics (map keys are converted to strings).
+    """
+    win = QtWidgets.QMainWindow()
+    manager = BackendManager(win)
+    manager.start(os.path.join(os.getcwd(), 'server.py'))
+    data = {'data': 'some data', 1: [1, 2]}
+    # the backend port is not known yet, the request is sent as json
+    manager.send_request(backend.echo_worker, data,
+                         on_receive=_on_msgpack_receive)
+    assert not list(manager._sockets)[-1]._binary
+    for i in range(50):
+        if manager._process.port and _msgpack_results:
+            break
+        QTest.qWait(100)
+    assert manager._process.supports_msgpack
+    manager.send_request(backend.echo_worker, data,
+                         on_receive=_on_msgpack_receive)
+    assert list(manager._sockets)[-1]._binary
+    for i in range(50):
+        if len(_msgpack_results) == 2:
+            break
+        QTest.qWait(100)
+    manager.stop()
+    expected = {'data': 'some data', '1': [1, 2]}
+    assert _msgpack_results == [expected, expected]
+
+
+_in_process_results = []
+
+
+def _on_in_process_receive(results):
+    _in_process_results.append(results)
+
+
+def test_in_process():
+    """
+    Runs the echo worker in a thread of the current process, no backend
+    process is started.
+    """
+    win = QtWidgets.QMainWindow()
+    manager = BackendManager(win)
+    manager.start(server_path(), in_process=True)
+    assert manager.running
+    assert manager._process is None
+    manager.send_request(backend.echo_worker, 'some data',
+                         on_receive=_on_in_process_receive)
+    for i in range(50):
+        if _in_process_results:
+            break
+        QTest.qWait(100)
+    assert _in_process_results == ['some data']
+    manager.stop()
+    assert not manager.running
+
+
+_running_workers = []
+_concurrent_workers = []
+_slow_results = []
+
+
+def _on_slow_receive(results):
+    _slow_results.append(results)
+
+
+def _slow_worker(data):
+    _running_workers.append(data)
+    _concurrent_workers.append(len(_running_workers))
+    time.sleep(0.05)
+    _running_workers.remove(data)
+    return data
+
+
+def test_in_process_one_worker_at_a_time():
+    """
+    Like the backend process, in-process workers are run one at a time.
+    """
+    # the global pool (shared with the application) must not be used
+    global_pool = QtCore.QThreadPool.globalInstance()
+    max_threads = global_pool.maxThreadCount()
+    global_pool.setMaxThreadCount(4)
+    try:
+        win = QtWidgets.QMainWindow()
+        manager = BackendManager(win)
+        manager.start(server_path(), in_process=True)
+        for i in range(4):
+            manager.send_request(_slow_worker, i,
+                                 on_receive=_on_slow_receive)
+        for i in range(50):
+            if len(_slow_results) == 4:
+                break
+            QTest.qWait(100)
+        manager.stop()
+    finally:
+        global_pool.setMaxThreadCount(max_threads)
+    assert _slow_results == [0, 1, 2, 3]
+    assert max(_concurrent_workers) == 1
+
+
+def test_in_process_to_shared_process():
+    """
+    Switches from in-process workers to a (shared) backend process.
+    """
+    win = QtWidgets.QMainWindow()
+    shared = BackendManager(win)
+    shared.start(server_path(), reuse=True)
+    manager = BackendManager(win)
+    manager.start(server_path(), in_process=True)
+    manager.start(server_path(), reuse=True)
+    assert not manager._in_process
+    assert manager._process is shared._process
+    manager.send_request(backend.echo_worker, 'some data')
+    assert not isinstance(list(manager._sockets)[-1], InProcessClient)
+    manager.stop()
+    shared.stop()
+
+
+_port_results = []
+
+
+def _on_port_receive(results):
+    _port_results.append(results)
+
+
+@cwd_at('test')
+def test_client_server_port():
+    """
+    Starts the backend on a port picked by the client (needed for backends
+    that use an older pyqode.core and do not report their port).
+    """
+    win = QtWidgets.QMainWindow()
+    manager = BackendManager(win)
+    port = manager.pick_free_port()
+    manager.start(os.path.join(os.getcwd(), 'server.py'), port=port)
+    assert manager._process.port == port
+    manager.send_request(backend.echo_worker, 'some data',
+                         on_receive=_on_port_receive)
+    for i in range(50):
+        if _port_results:
+            break
+        QTest.qWait(100)
+    manager.stop()
+    assert _port_results == ['some data']
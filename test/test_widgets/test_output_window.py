@@ -10,10 +10,21 @@ with open(os.path.join(DIRECTORY, 'parsed_output.txt')) as f:
     PARSED_OUTPUT = f.read()
 
 
+#: parsed operations, by raw text (parsing needs a QApplication so it cannot
+#: be done at import time)
+_OPERATIONS = {}
+
+
+def _parsed(raw):
+    if raw not in _OPERATIONS:
+        parser = output_window.AnsiEscapeCodeParser()
+        _OPERATIONS[raw] = parser.parse_text(output_window.FormattedText(raw))
+    return _OPERATIONS[raw]
+
+
 def test_parser():
     # functional test
-    parser = output_window.AnsiEscapeCodeParser()
-    operations = parser.parse_text(output_window.FormattedText(RAW_OUTPUT))
+    operations = _parsed(RAW_OUTPUT)
     assert len(operations) == 772
 
     # check if bold+underlined is correctly set
@@ -36,6 +47,43 @@ def test_parser():
     assert op.data.fmt.font().weight() != QtGui.QFont.Bold
 
 
+def _merge_draws(operations):
+    # a chunk boundary splits a draw operation in two, merge consecutive
+    # draws that use the same format
+    merged = []
+    for op in operations:
+        if (op.command == 'draw' and merged and
+                merged[-1].command == 'draw' and
+                merged[-1].data.fmt == op.data.fmt):
+            prev = merged[-1].data
+            merged[-1] = output_window.Operation('draw', output_window.FormattedText(
+                prev.txt + op.data.txt, prev.fmt))
+        else:
+            merged.append(op)
+    return merged
+
+
+def test_parser_chunked():
+    # output comes in arbitrary chunks, escape codes split across two chunks
+    # must give the same result as a single shot parse
+    expected = _merge_draws(_parsed(RAW_OUTPUT))
+    for size in (1, 7, 64, 1000):
+        parser = output_window.AnsiEscapeCodeParser()
+        operations = []
+        for i in range(0, len(RAW_OUTPUT), size):
+            operations += parser.parse_text(
+                output_window.FormattedText(RAW_OUTPUT[i:i + size]))
+        operations = _merge_draws(operations)
+        assert len(operations) == len(expected)
+        for op, expected_op in zip(operations, expected):
+            assert op.command == expected_op.command
+            if op.command == 'draw':
+                assert op.data.txt == expected_op.data.txt
+                assert op.data.fmt == expected_op.data.fmt
+            else:
+                assert op.data == expected_op.data
+
+
 def test_output_window_results():
     # functional test
     w = output_window.OutputWindow()